@@ -4,9 +4,31 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+from time import sleep
+import hashlib
+import json
+import os
+import shutil
+import threading
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
 import warnings
+import weakref
 warnings.filterwarnings('ignore')
+
+# DuckDB es opcional: solo hace falta para VENTAS_BACKEND=duckdb (pip install duckdb)
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Copy-on-Write: los recortes del DataFrame son vistas y nunca se copian de forma implícita
+pd.set_option('mode.copy_on_write', True)
 #pip freeze > requirements.txt
 ##streamlit run main.py
 
@@ -18,136 +40,1150 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Función para cargar y procesar los datos
-@st.cache_data
-def load_data():
+# Archivo de datos y snapshot columnar con el DataFrame ya limpio y tipado
+# (y el cubo diario calculado a partir de él). El snapshot son archivos Arrow IPC sin
+# comprimir que cada proceso abre con memory map: varios procesos de Streamlit en la
+# misma máquina comparten las mismas páginas del archivo y ninguno vuelve a leer el CSV.
+# Cada escritura es una versión (Ventas.snapshot/<escritura>/ con la tabla y el cubo) y
+# el archivo 'actual' indica la publicada: se publica con un solo renombrado, así que
+# nadie ve la tabla de una escritura con el cubo de otra
+CSV_PATH = 'Ventas.csv'
+SNAPSHOT_DIR = 'Ventas.snapshot'
+SNAPSHOT_POINTER_FILE = 'actual'
+SNAPSHOT_TABLE_FILE = 'tabla.arrow'
+SNAPSHOT_CUBE_FILE = 'cubo.arrow'
+# Segundos que se conserva una versión del snapshot después de que se publique la siguiente
+SNAPSHOT_GRACE_SECONDS = 600
+SNAPSHOT_META_KEY = b'ventas_csv'
+# Se incrementa cada vez que cambian las columnas o tipos que produce load_data()
+SNAPSHOT_FORMAT = 10
+# Bytes finales de la parte ya ingerida del CSV que se comparan para detectar que
+# el archivo solo ha crecido por el final
+TAIL_HASH_BYTES = 1 << 16
+# Tamaño de los bloques del hash encadenado del CSV
+HASH_BLOCK_BYTES = 1 << 20
+
+# Hash del contenido del CSV entre las posiciones [inicio, fin) (todo el archivo por defecto)
+def file_hash(path, inicio=0, fin=None):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        f.seek(inicio)
+        pendientes = -1 if fin is None else fin - inicio
+        while pendientes != 0:
+            bloque = f.read(1 << 20 if pendientes < 0 else min(1 << 20, pendientes))
+            if not bloque:
+                break
+            h.update(bloque)
+            if pendientes > 0:
+                pendientes -= len(bloque)
+    return h.hexdigest()
+
+# Hash encadenado del CSV hasta la posición 'fin': el de cada bloque completo de
+# HASH_BLOCK_BYTES incluye el del anterior, y el total es el del último más el resto.
+# Solo depende del contenido, así que al añadir filas se continúa desde 'bloques'
+# (posición y hash de los bloques completos de la huella anterior) sin releer el archivo.
+# Devuelve el hash total y los bloques completos para la próxima vez
+def chained_hash(path, fin, bloques=(0, '')):
+    posicion, cadena = bloques
+    with open(path, 'rb') as f:
+        f.seek(posicion)
+        while fin - posicion >= HASH_BLOCK_BYTES:
+            h = hashlib.blake2b(bytes.fromhex(cadena), digest_size=16)
+            h.update(f.read(HASH_BLOCK_BYTES))
+            cadena = h.hexdigest()
+            posicion += HASH_BLOCK_BYTES
+        h = hashlib.blake2b(bytes.fromhex(cadena), digest_size=16)
+        h.update(f.read(fin - posicion))
+    return h.hexdigest(), [posicion, cadena]
+
+# Firma barata del CSV (tamaño y fecha de modificación) que sirve de clave de la caché
+def csv_signature(csv_path=CSV_PATH):
     try:
-        # Cargar el archivo CSV
-        df = pd.read_csv('Ventas.csv')
-        
-        # Convertir fechas
-        df = df[df['Toma de contacto'].notna()]  # elimina filas con NaN
-        df = df[df['Toma de contacto'].str.strip() != '']  # elimina filas con cadenas vacías o solo espacios
-        df = df.reset_index(drop=True)  # reiniciar el índice después de eliminar filas
-
-        # Convertir fechas
-        df['Fecha de Creación'] = pd.to_datetime(df['Fecha de Creación'], format='%d/%m/%Y %H:%M')
-        df['Fecha de Conversión'] = pd.to_datetime(df['Fecha de Conversión'], format='%d/%m/%Y', errors='coerce')
-        df = df[(df['Fecha de Creación'].dt.year >= 2018) & (df['Fecha de Creación'].dt.year <= 2021)]
-        df = df.reset_index(drop=True)  # reiniciar el índice después de eliminar filas
-        
-        # Crear columnas adicionales
-        df['Año_Creacion'] = df['Fecha de Creación'].dt.year
-        df['Mes_Creacion'] = df['Fecha de Creación'].dt.month
-        df['Mes_Año_Creacion'] = df['Fecha de Creación'].dt.to_period('M')
-        
-        # Marcar si hubo conversión
-        df['Convertido'] = df['Producto'].notna()
-        
-        # Calcular tiempo hasta conversión
-        df['Dias_Hasta_Conversion'] = (df['Fecha de Conversión'] - df['Fecha de Creación']).dt.days.abs()
-        
-        return df
+        stat = os.stat(csv_path)
     except FileNotFoundError:
-        st.error("No se encontró el archivo 'datos_ventas.csv'. Asegúrate de que esté en la misma carpeta.")
         return None
-    except Exception as e:
-        st.error(f"Error al cargar los datos: {str(e)}")
+    return (stat.st_size, stat.st_mtime_ns)
+
+# Compara la huella con el CSV actual: 'actual' si no ha cambiado, 'anexado' si solo
+# se le han añadido filas al final desde la última ingesta, o None si hay que releerlo
+# (también si el snapshot se generó con otra ventana de años)
+def snapshot_status(huella, stat, ventana, csv_path=CSV_PATH):
+    if huella is None or huella.get('ventana') != list(ventana):
         return None
+    offset = huella['size']
+    if stat.st_size == offset:
+        if huella['mtime_ns'] == stat.st_mtime_ns or huella['hash'] == chained_hash(csv_path, stat.st_size)[0]:
+            return 'actual'
+        return None
+    if stat.st_size > offset:
+        # La parte ya ingerida debe seguir intacta y terminar en un salto de línea
+        inicio = max(offset - TAIL_HASH_BYTES, 0)
+        with open(csv_path, 'rb') as f:
+            f.seek(offset - 1)
+            fin_de_linea = f.read(1) == b'\n'
+        if fin_de_linea and huella['hash_final'] == file_hash(csv_path, inicio, offset):
+            return 'anexado'
+    return None
 
-# Función principal
-def main():
-    st.title("📊 Análisis Completo de Datos de Ventas")
-    st.markdown("---")
-    
-    # Cargar datos
-    df = load_data()
-    if df is None:
+# Abre un archivo Arrow IPC (Feather v2) con memory map, sin leer sus datos a memoria.
+# Devuelve la tabla y la huella guardada en sus metadatos
+def open_arrow(path):
+    tabla = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    metadata = tabla.schema.metadata or {}
+    return tabla, json.loads(metadata.get(SNAPSHOT_META_KEY, b'{}'))
+
+# Convierte a DataFrame una tabla abierta con open_arrow(). Las columnas numéricas y de
+# fechas sin nulos quedan como vistas de solo lectura sobre el archivo mapeado
+# (split_blocks evita que pandas las copie para consolidarlas en bloques). Con
+# 'columnas' solo se convierten esas: las páginas del resto del archivo no se cargan
+def arrow_to_pandas(tabla, columnas=None):
+    if columnas is not None:
+        tabla = tabla.select(columnas)
+    return tabla.to_pandas(split_blocks=True)
+
+# Abre la versión publicada del snapshot: tablas mapeadas del DataFrame y del cubo y su
+# huella, leída de la misma apertura que los datos. Devuelve None si no existe, si es de
+# otro formato o columnas, o si el cubo y la tabla no son de la misma escritura, y
+# entonces se vuelve a leer el CSV
+def open_snapshot(carpeta=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(carpeta, SNAPSHOT_POINTER_FILE), encoding='utf-8') as f:
+            version = os.path.join(carpeta, f.read().strip())
+        tabla, huella = open_arrow(os.path.join(version, SNAPSHOT_TABLE_FILE))
+        cubo, huella_cubo = open_arrow(os.path.join(version, SNAPSHOT_CUBE_FILE))
+    except (OSError, ValueError, pa.ArrowException):
+        return None
+    if huella.get('format') != SNAPSHOT_FORMAT or huella.get('columnas') != CSV_COLUMNS:
+        return None
+    if huella_cubo != huella:
+        return None
+    return {'tabla': tabla, 'cubo': cubo, 'huella': huella}
+
+# Devuelve el DataFrame (solo 'columnas', si se indican) y el cubo de un snapshot abierto
+def read_snapshot(snapshot, columnas=None):
+    return arrow_to_pandas(snapshot['tabla'], columnas), arrow_to_pandas(snapshot['cubo'])
+
+# Escribe un DataFrame en Arrow IPC con la huella del CSV en los metadatos
+def write_arrow(df, huella, path):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Los NaN de las columnas decimales se guardan como NaN y no como nulos, para que
+    # al leerlas sigan siendo vistas sobre el archivo en lugar de copias
+    for i, campo in enumerate(table.schema):
+        if pa.types.is_floating(campo.type):
+            table = table.set_column(i, campo, pa.array(df[campo.name].to_numpy(), from_pandas=False))
+    metadata = dict(table.schema.metadata or {})
+    metadata[SNAPSHOT_META_KEY] = json.dumps(huella).encode()
+    table = table.replace_schema_metadata(metadata)
+    with pa.OSFile(path, 'wb') as f, pa.ipc.new_file(f, table.schema) as escritor:
+        escritor.write_table(table)
+
+# Borra las versiones de 'carpeta' (subdirectorios) sustituidas por otra más reciente
+# hace más de 'gracia' segundos (la fecha de publicación es la del propio directorio).
+# Los procesos que aún usan una versión reciente la siguen viendo completa
+def remove_old_versions(carpeta, actual, gracia):
+    versiones = []
+    for nombre in os.listdir(carpeta):
+        ruta = os.path.join(carpeta, nombre)
+        if ruta == actual or not os.path.isdir(ruta) or nombre.endswith('.tmp'):
+            continue
+        try:
+            versiones.append((os.path.getmtime(ruta), ruta))
+        except OSError:
+            # Otro proceso la acaba de borrar
+            continue
+    publicadas = sorted(versiones) + [(os.path.getmtime(actual), actual)]
+    ahora = datetime.now().timestamp()
+    for (_, ruta), (sustituida, _) in zip(publicadas, publicadas[1:]):
+        if ahora - sustituida > gracia:
+            shutil.rmtree(ruta, ignore_errors=True)
+
+# Guarda el DataFrame limpio y el cubo junto con la huella del CSV de origen: tamaño
+# (byte hasta el que se ha ingerido), mtime, hash encadenado, hash del tramo final, filas
+# leídas y ventana de años y columnas con las que se leyó. 'escritura' identifica esta
+# escritura, para reconocer un cubo y una tabla que no se escribieron juntos. Con la
+# huella 'previa' (filas añadidas) el hash continúa desde ella y solo se leen los bytes nuevos
+def write_snapshot(df, cubo, stat, filas, ventana, previa=None, csv_path=CSV_PATH):
+    total, bloques = chained_hash(csv_path, stat.st_size, previa['bloques'] if previa else (0, ''))
+    huella = {
+        'format': SNAPSHOT_FORMAT,
+        'escritura': os.urandom(8).hex(),
+        'ventana': list(ventana),
+        'columnas': CSV_COLUMNS,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'hash': total,
+        'bloques': bloques,
+        'hash_final': file_hash(csv_path, max(stat.st_size - TAIL_HASH_BYTES, 0), stat.st_size),
+        'filas': filas,
+    }
+    # Cada escritura usa su propia carpeta y su propio puntero temporal, así que varios
+    # procesos pueden escribir a la vez: la versión publicada es la del último renombrado
+    version = os.path.join(SNAPSHOT_DIR, huella['escritura'])
+    temporal = version + '.tmp'
+    puntero = os.path.join(SNAPSHOT_DIR, SNAPSHOT_POINTER_FILE)
+    puntero_temporal = f"{puntero}.{huella['escritura']}.tmp"
+    try:
+        os.makedirs(temporal)
+        write_arrow(cubo, huella, os.path.join(temporal, SNAPSHOT_CUBE_FILE))
+        write_arrow(df, huella, os.path.join(temporal, SNAPSHOT_TABLE_FILE))
+        os.replace(temporal, version)
+        with open(puntero_temporal, 'w', encoding='utf-8') as f:
+            f.write(huella['escritura'])
+        os.replace(puntero_temporal, puntero)
+    except OSError:
+        # Sin permisos de escritura: se sigue trabajando sin snapshot
+        shutil.rmtree(temporal, ignore_errors=True)
+        if os.path.exists(puntero_temporal):
+            os.remove(puntero_temporal)
         return
-    
-    # Sidebar - Filtros
-    st.sidebar.header("🎛️ Filtros de Control")
-    
-    # Filtro por fecha de creación
-    min_date = df['Fecha de Creación'].min()
-    max_date = df['Fecha de Creación'].max()
-    
-    fecha_inicio = st.sidebar.date_input(
-        "Fecha de inicio",
-        value=min_date,
-        min_value=min_date,
-        max_value=max_date
+    remove_old_versions(SNAPSHOT_DIR, version, SNAPSHOT_GRACE_SECONDS)
+
+# Esquema del CSV declarado de antemano para el lector de pyarrow:
+# dimensiones de texto como diccionario (categorías) y Pedido como entero.
+# Las fechas se leen como texto y las convierte parse_fixed_dates(); la de conversión,
+# con pocos valores distintos, como diccionario para convertir cada valor una sola vez
+# (la de creación tiene casi un valor distinto por fila y codificarla cuesta más)
+CSV_COLUMN_TYPES = {
+    'Toma de contacto': pa.dictionary(pa.int32(), pa.string()),
+    'Fecha de Creación': pa.string(),
+    'Fecha de Conversión': pa.dictionary(pa.int32(), pa.string()),
+    'Pedido': pa.int32(),
+    'Producto': pa.dictionary(pa.int32(), pa.string()),
+}
+# Columnas del CSV que usa cada sección del panel (claves de compute_sections()).
+# El lector solo lee su unión: las demás columnas del export no se llegan a convertir
+SECTION_COLUMNS = {
+    'filtros': ['Fecha de Creación', 'Toma de contacto', 'Producto'],
+    'totales': ['Fecha de Creación', 'Fecha de Conversión', 'Producto'],
+    'mensual': ['Fecha de Creación', 'Producto'],
+    'anual': ['Fecha de Creación', 'Producto'],
+    'contacto': ['Toma de contacto', 'Producto'],
+    'producto': ['Producto'],
+    'dias_convertidos': ['Fecha de Creación', 'Fecha de Conversión', 'Producto'],
+    'semanal': ['Fecha de Creación', 'Producto'],
+    'diario': ['Fecha de Creación', 'Producto'],
+}
+CSV_COLUMNS = sorted({columna for columnas in SECTION_COLUMNS.values() for columna in columnas},
+                     key=list(CSV_COLUMN_TYPES).index)
+# Columnas de fecha y si llevan hora ('dd/mm/aaaa hh:mm') o no ('dd/mm/aaaa')
+CSV_DATE_COLUMNS = {
+    'Fecha de Creación': True,
+    'Fecha de Conversión': False,
+}
+DIAS_POR_MES = np.array([0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype=np.int32)
+
+# Convierte un arreglo de texto de Arrow con fechas de formato fijo ('dd/mm/aaaa' o
+# 'dd/mm/aaaa hh:mm') a timestamp[ns] leyendo los dígitos directamente de su buffer.
+# Las fechas vacías o no válidas quedan como nulas (NaT)
+def parse_fixed_dates(cadenas, con_hora):
+    n = len(cadenas)
+    if n == 0:
+        return pa.array([], type=pa.timestamp('ns'))
+    ancho = 16 if con_hora else 10
+    offsets = np.frombuffer(cadenas.buffers()[1], dtype=np.int32, count=n + 1, offset=cadenas.offset * 4)
+    buffer_datos = cadenas.buffers()[2]
+    datos = np.frombuffer(buffer_datos, dtype=np.uint8) if buffer_datos is not None else np.zeros(0, dtype=np.uint8)
+
+    inicios = offsets[:-1]
+    validas = (offsets[1:] - inicios) == ancho
+    if cadenas.null_count:
+        validas &= np.asarray(cadenas.is_valid())
+    if validas.all() and offsets[-1] - offsets[0] == n * ancho:
+        # Todas las cadenas tienen el ancho fijo: el buffer se ve como una matriz sin copiarlo
+        posiciones = None
+        texto = datos[offsets[0]:offsets[-1]].reshape(n, ancho)
+    else:
+        posiciones = np.flatnonzero(validas)
+        texto = datos[inicios[posiciones, None] + np.arange(ancho)]
+
+    ok = np.ones(len(texto), dtype=bool)
+    def numero(*columnas):
+        valor = np.zeros(len(texto), dtype=np.int32)
+        for k in columnas:
+            digito = texto[:, k] - np.uint8(48)
+            ok[digito > 9] = False
+            valor = valor * 10 + digito
+        return valor
+
+    dia = numero(0, 1)
+    mes = numero(3, 4)
+    año = numero(6, 7, 8, 9)
+    mes_valido = (mes >= 1) & (mes <= 12)
+    bisiesto = (año % 4 == 0) & ((año % 100 != 0) | (año % 400 == 0))
+    ok &= (texto[:, 2] == ord('/')) & (texto[:, 5] == ord('/')) & mes_valido
+    ok &= (dia >= 1) & (dia <= DIAS_POR_MES[np.where(mes_valido, mes, 0)]) & ~((mes == 2) & (dia == 29) & ~bisiesto)
+
+    # Días desde 1970-01-01 a partir de año, mes y día (algoritmo days_from_civil)
+    y = año - (mes <= 2)
+    era = y // 400
+    año_era = y - era * 400
+    dia_año = (153 * ((mes + 9) % 12) + 2) // 5 + dia - 1
+    dias = era.astype(np.int64) * 146097 + año_era * 365 + año_era // 4 - año_era // 100 + dia_año - 719468
+    minutos = dias * 1440
+    if con_hora:
+        hora = numero(11, 12)
+        minuto = numero(14, 15)
+        ok &= (texto[:, 10] == ord(' ')) & (texto[:, 13] == ord(':')) & (hora < 24) & (minuto < 60)
+        minutos += hora * 60 + minuto
+
+    fechas = (minutos * 60_000_000_000).view('datetime64[ns]')
+    fechas[~ok] = np.datetime64('NaT')
+    if posiciones is not None:
+        resultado = np.full(n, np.datetime64('NaT', 'ns'))
+        resultado[posiciones] = fechas
+        fechas = resultado
+    return pa.array(fechas, type=pa.timestamp('ns'), from_pandas=True)
+
+# Sustituye las columnas de fecha (texto) de una tabla o bloque de Arrow por timestamps.
+# En las columnas de diccionario se convierte cada cadena distinta una sola vez y el
+# resultado se reparte a las filas a través de los códigos
+def parse_date_columns(tabla):
+    if isinstance(tabla, pa.Table):
+        # Un único diccionario por columna para todos los bloques de la tabla
+        tabla = tabla.unify_dictionaries()
+    for columna, con_hora in CSV_DATE_COLUMNS.items():
+        indice = tabla.schema.get_field_index(columna)
+        valores = tabla.column(indice)
+        partes = valores.chunks if isinstance(valores, pa.ChunkedArray) else [valores]
+        if pa.types.is_dictionary(valores.type):
+            if partes:
+                por_valor = parse_fixed_dates(partes[0].dictionary, con_hora)
+            partes = [pc.take(por_valor, parte.indices) for parte in partes]
+        else:
+            partes = [parse_fixed_dates(parte, con_hora) for parte in partes]
+        if isinstance(valores, pa.ChunkedArray):
+            fechas = pa.chunked_array(partes, type=pa.timestamp('ns'))
+        else:
+            fechas = partes[0]
+        tabla = tabla.set_column(indice, columna, fechas)
+    return tabla
+
+# Ventana de años que se analiza, configurable sin tocar el código con las variables
+# de entorno VENTAS_YEAR_MIN y VENTAS_YEAR_MAX. Las filas de fuera se descartan al leer
+YEAR_MIN = int(os.environ.get('VENTAS_YEAR_MIN', 2018))
+YEAR_MAX = int(os.environ.get('VENTAS_YEAR_MAX', 2021))
+ANALYSIS_WINDOW = (YEAR_MIN, YEAR_MAX)
+
+# A partir de este tamaño el CSV se lee por bloques, descartando en cada bloque las
+# filas que luego se eliminarían, para que la memoria no dependa del tamaño del archivo
+CSV_STREAMING_BYTES = 64 << 20
+CSV_BLOCK_SIZE = 8 << 20
+
+# Filas de un bloque leído del CSV que sobreviven a la limpieza de build_sales_table():
+# toma de contacto no vacía y año de creación dentro de la ventana. Se aplica antes de
+# convertir las fechas, comparando el año como texto ('dd/mm/aaaa hh:mm'[6:10]), para
+# que las filas descartadas no lleguen a convertirse ni a pasar a pandas
+def filter_raw_batch(lote, ventana):
+    contacto = lote.column('Toma de contacto')
+    vacias = pc.equal(pc.utf8_trim_whitespace(contacto.dictionary), '')
+    sin_contacto = pc.fill_null(pc.take(vacias, contacto.indices), True)
+    año = pc.utf8_slice_codeunits(lote.column('Fecha de Creación'), 6, 10)
+    en_ventana = pc.and_(pc.greater_equal(año, f'{ventana[0]:04d}'), pc.less_equal(año, f'{ventana[1]:04d}'))
+    return lote.filter(pc.and_(pc.invert(sin_contacto), pc.fill_null(en_ventana, False)))
+
+# Lee el CSV con el motor de pyarrow y lo convierte a un DataFrame tipado con solo las
+# filas de la ventana de años. 'source' es la ruta del archivo o su contenido en memoria
+# (bytes o pa.Buffer). Devuelve el DataFrame y el número de filas leídas del CSV
+def read_sales_csv(source=CSV_PATH, ventana=ANALYSIS_WINDOW, streaming=False):
+    entrada = pa.BufferReader(source) if isinstance(source, (bytes, pa.Buffer)) else source
+    opciones = pacsv.ConvertOptions(
+        column_types=CSV_COLUMN_TYPES,
+        include_columns=CSV_COLUMNS,
+        strings_can_be_null=True,
     )
+    if not streaming:
+        tabla = pacsv.read_csv(entrada, convert_options=opciones)
+        filas = tabla.num_rows
+        lotes = [filter_raw_batch(lote, ventana) for lote in tabla.to_batches()]
+        table = parse_date_columns(pa.Table.from_batches(lotes, schema=tabla.schema))
+    else:
+        # Lectura por bloques: de cada bloque solo se guardan las filas válidas
+        lector = pacsv.open_csv(
+            entrada,
+            read_options=pacsv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+            convert_options=opciones,
+        )
+        lotes = []
+        filas = 0
+        for lote in lector:
+            filas += lote.num_rows
+            lotes.append(parse_date_columns(filter_raw_batch(lote, ventana)))
+        vacia = parse_date_columns(lector.schema.empty_table())
+        table = pa.Table.from_batches(lotes, schema=vacia.schema)
+
+    # Categorías para los diccionarios y Int32 con nulos para los enteros (Pedido)
+    df = table.to_pandas(types_mapper={pa.int32(): pd.Int32Dtype()}.get)
+    return df, filas
+
+# Lee las filas del CSV entre los bytes [inicio, fin). Si no se empieza desde el
+# principio del archivo se antepone la cabecera, para leer solo las filas añadidas.
+# Devuelve el DataFrame y el número de filas leídas del CSV
+def read_csv_range(inicio, fin, ventana=ANALYSIS_WINDOW, csv_path=CSV_PATH):
+    if inicio == 0:
+        # Sin copiar el archivo: el lector recorre el mapa en memoria
+        contenido = pa.memory_map(csv_path).read_buffer(fin)
+    else:
+        with open(csv_path, 'rb') as f:
+            cabecera = f.readline()
+            f.seek(inicio)
+            contenido = cabecera + f.read(fin - inicio)
+    return read_sales_csv(contenido, ventana, streaming=fin - inicio > CSV_STREAMING_BYTES)
+
+# Limpia y tipa el DataFrame leído del CSV
+def build_sales_table(df, ventana=ANALYSIS_WINDOW):
+    # Eliminar filas sin toma de contacto (NaN, cadenas vacías o solo espacios)
+    contacto = df['Toma de contacto']
+    vacias = contacto.cat.categories[contacto.cat.categories.str.strip() == '']
+    df = df[contacto.notna() & ~contacto.isin(vacias)]
+
+    # Las fechas ya vienen convertidas por el lector; quedan fuera las no válidas
+    df = df[(df['Fecha de Creación'].dt.year >= ventana[0]) & (df['Fecha de Creación'].dt.year <= ventana[1])]
+
+    # Ordenar por fecha de creación para poder filtrar rangos con búsqueda binaria
+    df = df.sort_values('Fecha de Creación', kind='stable')
+    df = df.reset_index(drop=True)  # reiniciar el índice después de eliminar filas
+
+    # Quitar de las categorías los valores que ya no aparecen
+    df['Toma de contacto'] = df['Toma de contacto'].cat.remove_unused_categories()
+    df['Producto'] = df['Producto'].cat.remove_unused_categories()
     
-    fecha_fin = st.sidebar.date_input(
-        "Fecha de fin",
-        value=max_date,
-        min_value=min_date,
-        max_value=max_date
-    )
+    # Día de creación como número de días desde 1970-01-01 (clave del cubo diario)
+    df['Dia_Ordinal'] = df['Fecha de Creación'].to_numpy().astype('datetime64[D]').astype(np.int32)
     
-    # Filtro por toma de contacto
-    tomas_contacto = ['Todos'] + list(df['Toma de contacto'].unique())
-    toma_seleccionada = st.sidebar.multiselect(
-        "Toma de contacto",
-        options=tomas_contacto,
-        default=[]
-    )
+    # Marcar si hubo conversión
+    df['Convertido'] = df['Producto'].notna()
     
-    # Filtro por producto
-    productos = ['Todos'] + list(df['Producto'].dropna().unique())
-    producto_seleccionado = st.sidebar.multiselect(
-        "Producto",
-        options=productos,
-        default=[]
-    )
+    # Calcular tiempo hasta conversión
+    df['Dias_Hasta_Conversion'] = (df['Fecha de Conversión'] - df['Fecha de Creación']).dt.days.abs().astype(np.float32)
     
-    # Aplicar filtros
-    df_filtered = df[
-        (df['Fecha de Creación'].dt.date >= fecha_inicio) &
-        (df['Fecha de Creación'].dt.date <= fecha_fin)
+    return df
+
+# Deja dos columnas categóricas con las mismas categorías (primero las de 'a')
+# para que al concatenarlas se conserve el tipo categórico
+def align_categories(a, b, columnas):
+    for columna in columnas:
+        categorias = a[columna].cat.categories.union(b[columna].cat.categories, sort=False)
+        a[columna] = a[columna].cat.set_categories(categorias)
+        b[columna] = b[columna].cat.set_categories(categorias)
+    return a, b
+
+# Añade filas nuevas (ya limpias) a la tabla manteniendo el orden por fecha de creación.
+# Si todas son posteriores a la última fila, basta con concatenarlas al final
+def append_sales_rows(df, nuevas):
+    if nuevas.empty:
+        return df
+    df, nuevas = align_categories(df, nuevas, ['Toma de contacto', 'Producto'])
+    en_orden = df.empty or nuevas['Fecha de Creación'].iloc[0] >= df['Fecha de Creación'].iloc[-1]
+    df = pd.concat([df, nuevas], ignore_index=True)
+    if not en_orden:
+        df = df.sort_values('Fecha de Creación', kind='stable', ignore_index=True)
+    return df
+
+# Índice de filas de una columna categórica: las posiciones de las filas de cada
+# categoría quedan contiguas (y en orden ascendente) dentro de 'filas', entre
+# limites[codigo] y limites[codigo + 1]
+def build_row_index(columna):
+    codigos = columna.cat.codes.to_numpy()
+    filas = np.argsort(codigos, kind='stable')
+    conteos = np.bincount(codigos[codigos >= 0], minlength=len(columna.cat.categories))
+    limites = np.concatenate(([0], np.cumsum(conteos))) + np.count_nonzero(codigos < 0)
+    return {
+        'categorias': columna.cat.categories,
+        'filas': filas,
+        'limites': limites,
+    }
+
+# Posiciones ordenadas de las filas del tramo [inicio, fin) cuyo valor está en 'valores'.
+# El coste depende del tamaño de la selección, no del de la tabla
+def select_rows(indice, valores, inicio, fin):
+    codigos = indice['categorias'].get_indexer(valores)
+    partes = []
+    for codigo in codigos[codigos >= 0]:
+        filas = indice['filas'][indice['limites'][codigo]:indice['limites'][codigo + 1]]
+        a, b = np.searchsorted(filas, [inicio, fin])
+        partes.append(filas[a:b])
+
+    if not partes:
+        return np.empty(0, dtype=np.intp)
+    filas = np.concatenate(partes)
+    filas.sort()
+    return filas
+
+# Cubo diario preagregado: una fila por (día, toma de contacto, producto) con el número
+# de registros, de ventas y la suma y suma de cuadrados de los días hasta la conversión.
+# Todas las secciones del panel se calculan a partir de él en lugar de las filas
+def build_daily_cube(df):
+    # Las sumas se acumulan en float64 para no perder precisión
+    dias = df['Dias_Hasta_Conversion'].astype(np.float64)
+    celdas = pd.DataFrame({
+        'Dia': df['Dia_Ordinal'],
+        'Toma de contacto': df['Toma de contacto'],
+        'Producto': df['Producto'],
+        'Convertido': df['Convertido'],
+        'Dias': dias,
+        'Dias2': dias * dias,
+    })
+    cubo = celdas.groupby(['Dia', 'Toma de contacto', 'Producto'], observed=True, dropna=False).agg(
+        Registros=('Convertido', 'size'),
+        Ventas=('Convertido', 'sum'),
+        Con_Dias=('Dias', 'count'),
+        Suma_Dias=('Dias', 'sum'),
+        Suma_Dias2=('Dias2', 'sum'),
+    ).reset_index()
+    cubo['Dia'] = cubo['Dia'].to_numpy().astype('datetime64[D]').astype('datetime64[ns]')
+    return cubo
+
+# Suma al cubo las celdas de un cubo calculado con filas nuevas
+def merge_daily_cubes(cubo, nuevo):
+    if nuevo.empty:
+        return cubo
+    cubo, nuevo = align_categories(cubo, nuevo, ['Toma de contacto', 'Producto'])
+    return pd.concat([cubo, nuevo], ignore_index=True).groupby(
+        ['Dia', 'Toma de contacto', 'Producto'], observed=True, dropna=False
+    ).sum().reset_index()
+
+# Una selección múltiple filtra solo si tiene valores y no incluye 'Todos'
+def is_active(seleccion):
+    return bool(seleccion) and 'Todos' not in seleccion
+
+# Celdas del cubo dentro del rango de fechas y de las selecciones activas
+def filter_cube(cubo, selecciones, fecha_inicio, fecha_fin):
+    inicio, fin = date_range_bounds(cubo['Dia'], fecha_inicio, fecha_fin)
+    cubo = cubo.iloc[inicio:fin]
+    for columna, seleccion in selecciones.items():
+        if is_active(seleccion):
+            cubo = cubo[cubo[columna].isin(seleccion)]
+    return cubo
+
+# Columnas del cubo que se acumulan para las métricas principales
+KPI_COLUMNS = ['Registros', 'Ventas', 'Con_Dias', 'Suma_Dias']
+
+# Sumas acumuladas por día de calendario (desde el primer día del cubo) de las
+# columnas de las métricas: el total de un rango de fechas es la resta de dos posiciones
+def build_prefix_sums(cubo):
+    primer_dia = cubo['Dia'].iloc[0]
+    ordinales = (cubo['Dia'] - primer_dia).dt.days.to_numpy()
+    acumulados = {'primer_dia': primer_dia.date()}
+    for columna in KPI_COLUMNS:
+        por_dia = np.bincount(ordinales, weights=cubo[columna].to_numpy(dtype=np.float64))
+        acumulados[columna] = np.concatenate(([0.0], np.cumsum(por_dia)))
+    return acumulados
+
+# Totales de las columnas de las métricas entre dos fechas (incluidas) en O(1)
+def range_totals(acumulados, fecha_inicio, fecha_fin):
+    n_dias = len(acumulados['Registros']) - 1
+    inicio = min(max((fecha_inicio - acumulados['primer_dia']).days, 0), n_dias)
+    fin = min(max((fecha_fin - acumulados['primer_dia']).days + 1, inicio), n_dias)
+    return {columna: acumulados[columna][fin] - acumulados[columna][inicio] for columna in KPI_COLUMNS}
+
+# Agrega los vectores diarios por una clave calculada para cada día del calendario.
+# Las etiquetas de cada grupo se toman del primer día en que aparece la clave
+def group_daily(claves, etiquetas, nombre, registros, ventas):
+    valores, primeros, inversa = np.unique(claves, return_index=True, return_inverse=True)
+    tabla = pd.DataFrame({
+        nombre: etiquetas[primeros],
+        'Toma de contacto': np.bincount(inversa, weights=registros, minlength=len(valores)).astype(np.int64),
+        'Convertido': np.bincount(inversa, weights=ventas, minlength=len(valores)).astype(np.int64),
+    })
+    # Igual que un groupby: solo los grupos con registros
+    return tabla[tabla['Toma de contacto'] > 0].reset_index(drop=True)
+
+# Series temporales que se derivan del vector diario
+ROLLUP_KEYS = ['diario', 'mensual', 'anual', 'semanal']
+
+# Motor de agregación: calcula en una sola pasada (np.bincount sobre el ordinal del día)
+# los registros y ventas por día, y a partir de ese vector diario las series de 'claves'
+# (diaria, mensual, anual y por día de la semana)
+def rollup_engine(cubo, claves=ROLLUP_KEYS):
+    claves = [clave for clave in claves if clave in ROLLUP_KEYS]
+    if not claves:
+        return {}
+    if cubo.empty:
+        registros = ventas = np.zeros(0)
+        dias = pd.DatetimeIndex([])
+    else:
+        primer_dia = cubo['Dia'].iloc[0]
+        ordinales = (cubo['Dia'] - primer_dia).dt.days.to_numpy()
+        registros = np.bincount(ordinales, weights=cubo['Registros'].to_numpy(dtype=np.float64))
+        ventas = np.bincount(ordinales, weights=cubo['Ventas'].to_numpy(dtype=np.float64))
+        dias = pd.date_range(primer_dia, periods=len(registros), freq='D')
+
+    tablas = {}
+    if 'diario' in claves:
+        tablas['diario'] = group_daily(np.arange(len(dias)), dias, 'Fecha_Solo', registros, ventas)
+    if 'mensual' in claves:
+        meses = dias.year * 12 + dias.month
+        tablas['mensual'] = group_daily(meses, dias.to_period('M'), 'Mes_Año_Creacion', registros, ventas)
+    if 'anual' in claves:
+        tablas['anual'] = group_daily(dias.year, dias.year, 'Año_Creacion', registros, ventas)
+    if 'semanal' in claves:
+        # Todos los días de la semana aparecen, aunque no tengan registros
+        tablas['semanal'] = pd.DataFrame({
+            'Dia_Semana': np.arange(7),
+            'Toma de contacto': np.bincount(dias.dayofweek, weights=registros, minlength=7).astype(np.int64),
+            'Convertido': np.bincount(dias.dayofweek, weights=ventas, minlength=7).astype(np.int64),
+        })
+    return tablas
+
+# Combina los filtros de selección múltiple dentro del tramo de fechas [inicio, fin).
+# Devuelve None si ningún filtro está activo (vale el tramo completo) o las posiciones
+# de las filas que cumplen todos los filtros. 'Todos' equivale a no filtrar esa columna
+def filter_rows(indices, selecciones, inicio, fin):
+    filas = None
+    for columna, seleccion in selecciones.items():
+        if not is_active(seleccion):
+            continue
+        filas_columna = select_rows(indices[columna], seleccion, inicio, fin)
+        if filas is None:
+            filas = filas_columna
+        else:
+            filas = np.intersect1d(filas, filas_columna, assume_unique=True)
+    return filas
+
+# Columnas de la tabla que usa el panel una vez cargada (dataset_info(), compute_sections()
+# y los índices de load_data()). La tabla cargada y el snapshot solo conservan estas
+PANEL_COLUMNS = ['Toma de contacto', 'Fecha de Creación', 'Producto', 'Convertido', 'Dias_Hasta_Conversion']
+
+# Marca como de solo lectura los arrays de numpy (también los que hay dentro de dicts)
+def make_read_only(valor):
+    if isinstance(valor, np.ndarray):
+        valor.flags.writeable = False
+    elif isinstance(valor, dict):
+        for elemento in valor.values():
+            make_read_only(elemento)
+    return valor
+
+# Función para cargar y procesar los datos de la ventana de años (año inicial, año final).
+# Los datos son de solo lectura y se comparten entre sesiones (los DataFrames están
+# protegidos por copy-on-write y los arrays se marcan como no modificables)
+def load_data(ventana=ANALYSIS_WINDOW):
+    stat = os.stat(CSV_PATH)
+    snapshot = open_snapshot()
+    huella = snapshot['huella'] if snapshot is not None else None
+    estado = snapshot_status(huella, stat, ventana)
+
+    if estado == 'actual':
+        # Usar el snapshot si el CSV no ha cambiado desde que se generó
+        df, cubo = read_snapshot(snapshot, PANEL_COLUMNS)
+    elif estado == 'anexado':
+        # El CSV solo ha crecido: se procesan las filas nuevas y se integran en la
+        # tabla y el cubo del snapshot
+        df, cubo = read_snapshot(snapshot)
+        nuevas, filas_nuevas = read_csv_range(huella['size'], stat.st_size, ventana)
+        filas = huella['filas'] + filas_nuevas
+        nuevas = build_sales_table(nuevas, ventana)
+        cubo = merge_daily_cubes(cubo, build_daily_cube(nuevas))
+        df = append_sales_rows(df, nuevas[PANEL_COLUMNS])
+    else:
+        # Cargar el archivo CSV completo
+        df, filas = read_csv_range(0, stat.st_size, ventana)
+        df = build_sales_table(df, ventana)
+        cubo = build_daily_cube(df)
+
+    # La tabla conserva las mismas columnas venga del snapshot o del CSV
+    df = df[PANEL_COLUMNS]
+    if estado != 'actual':
+        write_snapshot(df, cubo, stat, filas, ventana, huella if estado == 'anexado' else None)
+
+    # Índices de filas para los filtros de selección múltiple
+    indices = {
+        'Toma de contacto': build_row_index(df['Toma de contacto']),
+        'Producto': build_row_index(df['Producto']),
+    }
+    return make_read_only({
+        'df': df,
+        'indices': indices,
+        'convertidas': np.flatnonzero(df['Convertido'].to_numpy()),
+        'cubo': cubo,
+        'acumulados': build_prefix_sums(cubo),
+    })
+
+# Segundos sin cambios en el CSV antes de recargarlo (puede escribirse en varias
+# operaciones) y cada cuánto se comprueba su firma por si se pierde algún evento
+REFRESH_SETTLE_SECONDS = 1.0
+REFRESH_POLL_SECONDS = 30.0
+
+# Avisa al hilo de recarga cuando el CSV se modifica, se crea o se sustituye por otro
+class CsvChangeHandler(FileSystemEventHandler):
+    def __init__(self, cambio, csv_path=CSV_PATH):
+        self.cambio = cambio
+        self.ruta = os.path.abspath(csv_path)
+
+    def on_any_event(self, event):
+        rutas = (event.src_path, getattr(event, 'dest_path', ''))
+        if self.ruta in (os.path.abspath(ruta) for ruta in rutas if ruta):
+            self.cambio.set()
+
+# Almacén de datos: un dict al que el hilo de recarga puede apuntar con weakref
+class DataStore(dict):
+    pass
+
+# Carga con 'cargar' la nueva versión si el CSV ha cambiado y la publica sustituyendo la
+# referencia en el almacén (un solo cambio atómico). Si falla, se sigue sirviendo la
+# versión anterior y se guarda el error
+def refresh_store(almacen, cargar, ventana):
+    firma = csv_signature()
+    if firma is None or firma == almacen['firma']:
+        return
+    try:
+        datos = cargar(ventana)
+    except Exception as e:
+        almacen['error'] = str(e)
+    else:
+        almacen['datos'] = datos
+        almacen['error'] = None
+    almacen['firma'] = firma
+
+# Hilo de recarga: cuando el CSV cambia, recarga los datos fuera de las peticiones de los
+# usuarios. Solo guarda una referencia débil al almacén: termina (y para el observador
+# de watchdog) cuando se activa 'parar', que ocurre en cuanto la caché suelta el almacén
+def refresh_loop(referencia, cargar, ventana, cambio, parar, observador):
+    try:
+        while not parar.is_set():
+            cambio.wait(REFRESH_POLL_SECONDS)
+            # Esperar a que el archivo deje de cambiar
+            while cambio.is_set() and not parar.is_set():
+                cambio.clear()
+                cambio.wait(REFRESH_SETTLE_SECONDS)
+            almacen = referencia()
+            if almacen is None or parar.is_set():
+                break
+            refresh_store(almacen, cargar, ventana)
+            del almacen
+    finally:
+        if observador is not None:
+            observador.stop()
+
+# Detiene el hilo de recarga de un almacén (y lo despierta si está esperando)
+def stop_refresh(parar, cambio):
+    parar.set()
+    cambio.set()
+
+# Crea un almacén con la versión de los datos que devuelve 'cargar' y arranca su hilo de
+# recarga, que vigila el CSV con watchdog y publica las versiones siguientes
+def open_store(cargar, ventana):
+    firma = csv_signature()
+    almacen = DataStore(datos=cargar(ventana), firma=firma, error=None)
+    cambio = threading.Event()
+    parar = threading.Event()
+    try:
+        observador = Observer()
+        observador.schedule(CsvChangeHandler(cambio), os.path.dirname(os.path.abspath(CSV_PATH)))
+        observador.daemon = True
+        observador.start()
+    except OSError:
+        # Sin eventos del sistema de archivos: basta la comprobación periódica
+        observador = None
+    weakref.finalize(almacen, stop_refresh, parar, cambio)
+    threading.Thread(
+        target=refresh_loop,
+        args=(weakref.ref(almacen), cargar, ventana, cambio, parar, observador),
+        daemon=True,
+    ).start()
+    return almacen
+
+# Almacén con la versión publicada de los datos, compartido por todas las sesiones del
+# proceso. La primera carga se hace aquí; las siguientes, en el hilo de recarga. Si la
+# entrada sale de la caché (se vacía, se edita el script...), el hilo y el observador
+# de ese almacén se detienen
+@st.cache_resource(max_entries=1)
+def data_store(ventana):
+    return open_store(load_data, ventana)
+
+# Versión publicada de un almacén ('store') para esta ejecución del script, o None si
+# no se pudo cargar
+def current_version(store, ventana):
+    try:
+        almacen = store(ventana)
+    except FileNotFoundError:
+        st.error(f"No se encontró el archivo '{CSV_PATH}'. Asegúrate de que esté en la misma carpeta.")
+        return None
+    except Exception as e:
+        st.error(f"Error al cargar los datos: {str(e)}")
+        return None
+    if almacen['error']:
+        st.sidebar.warning(f"No se pudo recargar '{CSV_PATH}': {almacen['error']}. Se muestran los datos anteriores.")
+    return almacen['datos']
+
+# Versión actual de los datos para esta ejecución del script, o None si no se pudieron cargar
+def current_data(ventana=ANALYSIS_WINDOW):
+    return current_version(data_store, ventana)
+
+# Posiciones [inicio, fin) de las filas creadas entre dos fechas (incluidas).
+# Requiere que la columna esté ordenada, como la deja load_data()
+def date_range_bounds(fechas, fecha_inicio, fecha_fin):
+    valores = fechas.to_numpy()
+    desde = np.datetime64(fecha_inicio, 'ns')
+    hasta = np.datetime64(fecha_fin + timedelta(days=1), 'ns')
+    inicio, fin = np.searchsorted(valores, [desde, hasta], side='left')
+    return int(inicio), int(fin)
+
+# Datos generales para la barra lateral: periodo, opciones de los filtros y total de filas
+def dataset_info(datos):
+    df = datos['df']
+    return {
+        # El DataFrame está ordenado por fecha de creación
+        'min_date': df['Fecha de Creación'].iloc[0],
+        'max_date': df['Fecha de Creación'].iloc[-1],
+        'contactos': list(df['Toma de contacto'].unique()),
+        'productos': list(df['Producto'].dropna().unique()),
+        'total': len(df),
+    }
+
+# Datos que puede calcular compute_sections(), uno por tabla o serie del panel
+SECTION_KEYS = ['totales', 'mensual', 'anual', 'contacto', 'producto', 'dias_convertidos', 'semanal', 'diario']
+
+# Calcula los datos de las secciones del panel indicadas en 'claves' (todas por defecto)
+# para el estado de los filtros
+def compute_sections(datos, fecha_inicio, fecha_fin, selecciones, claves=SECTION_KEYS):
+    df = datos['df']
+    filtra_seleccion = any(is_active(seleccion) for seleccion in selecciones.values())
+
+    # Aplicar filtros sobre el cubo diario: los agregados de todas las secciones salen de él
+    cubo_filtrado = filter_cube(datos['cubo'], selecciones, fecha_inicio, fecha_fin)
+    secciones = rollup_engine(cubo_filtrado, claves)
+
+    # Sin filtros de selección, los totales del rango salen de las sumas acumuladas
+    if 'totales' in claves:
+        if filtra_seleccion:
+            secciones['totales'] = cubo_filtrado[KPI_COLUMNS].sum()
+        else:
+            secciones['totales'] = range_totals(datos['acumulados'], fecha_inicio, fecha_fin)
+
+    if 'contacto' in claves:
+        secciones['contacto'] = cubo_filtrado.groupby('Toma de contacto', observed=True).agg(
+            Total_Registros=('Registros', 'sum'),
+            Total_Ventas=('Ventas', 'sum')
+        ).reset_index()
+    if 'producto' in claves:
+        secciones['producto'] = cubo_filtrado.groupby('Producto', observed=True).agg(
+            Cantidad_Ventas=('Ventas', 'sum')
+        ).reset_index()
+
+    # La distribución necesita las filas: solo se toman los días de las convertidas
+    # del rango (posiciones precalculadas), sin copiar el resto de columnas
+    if 'dias_convertidos' in claves:
+        inicio, fin = date_range_bounds(df['Fecha de Creación'], fecha_inicio, fecha_fin)
+        convertidas = datos['convertidas']
+        convertidas = convertidas[np.searchsorted(convertidas, inicio):np.searchsorted(convertidas, fin)]
+        filas = filter_rows(datos['indices'], selecciones, inicio, fin)
+        if filas is not None:
+            convertidas = np.intersect1d(convertidas, filas, assume_unique=True)
+        secciones['dias_convertidos'] = df['Dias_Hasta_Conversion'].iloc[convertidas]
+    return secciones
+
+# Motor de datos del panel: 'pandas' (tabla en memoria, por defecto) o 'duckdb'
+# (dataset Parquet particionado en disco; las consultas se resuelven en SQL)
+DATA_BACKEND = os.environ.get('VENTAS_BACKEND', 'pandas')
+# Dataset Parquet particionado por año y mes de creación, con una versión por cada firma
+# del CSV (Ventas_particionado/<tamaño>_<mtime>/anio=AAAA/mes=M/*.parquet). Una versión
+# publicada no se modifica: las consultas en curso de otros procesos siguen leyéndola
+PARTITIONED_PATH = 'Ventas_particionado'
+# Segundos que se conserva una versión después de que se publique la siguiente
+PARTITIONED_GRACE_SECONDS = 600
+# Segundos tras los que se da por abandonado el bloqueo de una reconstrucción
+PARTITIONED_LOCK_SECONDS = 1800
+# Nombre de las columnas de los filtros en la tabla de DuckDB
+SQL_COLUMNS = {
+    'Toma de contacto': 'contacto',
+    'Producto': 'producto',
+}
+
+# Literal de cadena para SQL (COPY y las vistas no admiten parámetros)
+def sql_string(valor):
+    return str(valor).replace("'", "''")
+
+# Directorio de la versión del dataset particionado para una firma del CSV
+def partitioned_version(firma):
+    return os.path.join(PARTITIONED_PATH, f'{firma[0]}_{firma[1]}')
+
+# Convierte el CSV completo (todos los años) en la versión 'destino' del dataset
+# particionado, con la misma limpieza que build_sales_table(). 'fila' es la posición en
+# el orden por fecha de creación (con los empates en el orden del CSV), igual que el
+# índice de la tabla de pandas. Se escribe aparte y se publica con un solo renombrado
+def build_duckdb(con, destino, csv_path=CSV_PATH):
+    temporal = destino + '.tmp'
+    shutil.rmtree(temporal, ignore_errors=True)
+    con.execute(f"""
+        COPY (
+            WITH crudo AS (
+                SELECT
+                    row_number() OVER () AS linea,
+                    "Toma de contacto" AS contacto,
+                    try_strptime("Fecha de Creación", '%d/%m/%Y %H:%M') AS creacion,
+                    try_strptime("Fecha de Conversión", '%d/%m/%Y') AS conversion,
+                    "Producto" AS producto
+                FROM read_csv('{sql_string(csv_path)}', header = true, all_varchar = true)
+            )
+            SELECT
+                row_number() OVER (ORDER BY creacion, linea) AS fila,
+                contacto,
+                creacion,
+                conversion,
+                producto,
+                producto IS NOT NULL AS convertido,
+                abs(floor(date_diff('second', creacion, conversion) / 86400)) AS dias,
+                year(creacion) AS anio,
+                month(creacion) AS mes
+            FROM crudo
+            WHERE trim(contacto) <> '' AND creacion IS NOT NULL
+            ORDER BY fila
+        ) TO '{sql_string(temporal)}' (FORMAT parquet, PARTITION_BY (anio, mes))
+    """)
+    os.replace(temporal, destino)
+
+# Intenta tomar el bloqueo de una reconstrucción (archivo creado en exclusiva).
+# Un bloqueo más antiguo que PARTITIONED_LOCK_SECONDS se elimina para poder reintentar
+def acquire_build_lock(ruta):
+    try:
+        os.close(os.open(ruta, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        try:
+            if datetime.now().timestamp() - os.path.getmtime(ruta) > PARTITIONED_LOCK_SECONDS:
+                os.remove(ruta)
+        except OSError:
+            pass
+        return False
+
+# Devuelve el directorio de la versión del dataset para la firma del CSV, generándola si
+# no existe. Solo un proceso la genera; los demás esperan a que se publique
+def ensure_partitioned_dataset(con, firma):
+    destino = partitioned_version(firma)
+    cerrojo = destino + '.lock'
+    os.makedirs(PARTITIONED_PATH, exist_ok=True)
+    while not os.path.isdir(destino):
+        if acquire_build_lock(cerrojo):
+            try:
+                if not os.path.isdir(destino):
+                    build_duckdb(con, destino)
+            finally:
+                os.remove(cerrojo)
+        else:
+            sleep(0.5)
+    return destino
+
+# Vista 'ventas' sobre una versión del dataset particionado con solo la ventana de años
+# del análisis: las particiones de los demás años no se llegan a leer
+def create_sales_view(con, version, ventana):
+    con.execute(f"""
+        CREATE OR REPLACE VIEW ventas AS
+        SELECT * FROM read_parquet('{sql_string(version)}/*/*/*.parquet', hive_partitioning = true)
+        WHERE anio BETWEEN {int(ventana[0])} AND {int(ventana[1])}
+    """)
+
+# Conexión de DuckDB en memoria con la vista sobre la versión del dataset particionado
+# que corresponde a la firma actual del CSV. Cada consulta usa su propio cursor. Sin
+# archivo de base de datos, varios procesos pueden usarlo a la vez
+def load_duckdb(ventana=ANALYSIS_WINDOW):
+    firma = csv_signature()
+    if firma is None:
+        raise FileNotFoundError(CSV_PATH)
+    con = duckdb.connect()
+    version = ensure_partitioned_dataset(con, firma)
+    create_sales_view(con, version, ventana)
+    remove_old_versions(PARTITIONED_PATH, version, PARTITIONED_GRACE_SECONDS)
+    return con
+
+# Almacén con la conexión publicada, una por proceso. Igual que con data_store(), cuando
+# el CSV cambia el hilo de recarga genera la nueva versión del dataset fuera de las
+# peticiones (tras esperar a que el archivo deje de cambiar) y solo entonces sustituye la
+# conexión; mientras tanto se sigue consultando la versión anterior
+@st.cache_resource(max_entries=1)
+def duckdb_store(ventana):
+    return open_store(load_duckdb, ventana)
+
+# Conexión de DuckDB para esta ejecución del script, o None si no se pudo preparar
+def current_duckdb(ventana=ANALYSIS_WINDOW):
+    if duckdb is None:
+        st.error("El motor 'duckdb' necesita el paquete duckdb (pip install duckdb).")
+        return None
+    return current_version(duckdb_store, ventana)
+
+# Condición WHERE y parámetros para el rango de fechas y las selecciones activas.
+# Las condiciones sobre anio/mes solo usan columnas de partición, así DuckDB descarta
+# sin abrirlos los ficheros de los meses fuera del rango
+def sql_filters(fecha_inicio, fecha_fin, selecciones):
+    condiciones = [
+        'anio BETWEEN ? AND ?', '(anio > ? OR mes >= ?)', '(anio < ? OR mes <= ?)',
+        'creacion >= ?', 'creacion < ?',
     ]
-    
-    if toma_seleccionada:
-        #df_filtered = df_filtered[df_filtered['Toma de contacto'] == toma_seleccionada]
-        df_filtered = df_filtered[df_filtered['Toma de contacto'].isin(toma_seleccionada)]
-    
-    if producto_seleccionado:
-        #df_filtered = df_filtered[df_filtered['Producto'] == producto_seleccionado]
-        df_filtered = df_filtered[df_filtered['Toma de contacto'].isin(producto_seleccionado)]
-    
-    # Métricas principales
+    parametros = [
+        fecha_inicio.year, fecha_fin.year, fecha_inicio.year, fecha_inicio.month, fecha_fin.year, fecha_fin.month,
+        datetime.combine(fecha_inicio, time()), datetime.combine(fecha_fin + timedelta(days=1), time()),
+    ]
+    for columna, seleccion in selecciones.items():
+        if is_active(seleccion):
+            condiciones.append(f"{SQL_COLUMNS[columna]} IN ({', '.join('?' * len(seleccion))})")
+            parametros.extend(seleccion)
+    return ' AND '.join(condiciones), parametros
+
+# Equivalente de dataset_info() consultando DuckDB
+def dataset_info_sql(con):
+    cursor = con.cursor()
+    min_date, max_date, total = cursor.execute("SELECT min(creacion), max(creacion), count(*) FROM ventas").fetchone()
+    # Opciones en el orden en que aparecen por fecha, como Series.unique() en pandas
+    contactos = cursor.execute("SELECT contacto FROM ventas GROUP BY contacto ORDER BY min(fila)").fetchall()
+    productos = cursor.execute(
+        "SELECT producto FROM ventas WHERE producto IS NOT NULL GROUP BY producto ORDER BY min(fila)"
+    ).fetchall()
+    return {
+        'min_date': pd.Timestamp(min_date),
+        'max_date': pd.Timestamp(max_date),
+        'contactos': [fila[0] for fila in contactos],
+        'productos': [fila[0] for fila in productos],
+        'total': total,
+    }
+
+# Equivalente de compute_sections() con las agregaciones resueltas en DuckDB
+def compute_sections_sql(con, fecha_inicio, fecha_fin, selecciones, claves=SECTION_KEYS):
+    cursor = con.cursor()
+    donde, parametros = sql_filters(fecha_inicio, fecha_fin, selecciones)
+
+    # Serie diaria agregada en SQL; el resto de series temporales se derivan de ella
+    secciones = {}
+    if any(clave in ROLLUP_KEYS for clave in claves):
+        diario = cursor.execute(f"""
+            SELECT CAST(creacion AS DATE) AS Dia, count(*) AS Registros, count(*) FILTER (convertido) AS Ventas
+            FROM ventas WHERE {donde} GROUP BY 1 ORDER BY 1
+        """, parametros).df()
+        diario['Dia'] = diario['Dia'].astype('datetime64[ns]')
+        secciones = rollup_engine(diario, claves)
+
+    if 'totales' in claves:
+        totales = cursor.execute(f"""
+            SELECT count(*), count(*) FILTER (convertido), count(dias), coalesce(sum(dias), 0)
+            FROM ventas WHERE {donde}
+        """, parametros).fetchone()
+        secciones['totales'] = dict(zip(KPI_COLUMNS, totales))
+
+    if 'contacto' in claves:
+        secciones['contacto'] = cursor.execute(f"""
+            SELECT contacto AS "Toma de contacto", count(*) AS Total_Registros, count(*) FILTER (convertido) AS Total_Ventas
+            FROM ventas WHERE {donde} GROUP BY contacto ORDER BY min(fila)
+        """, parametros).df()
+    if 'producto' in claves:
+        secciones['producto'] = cursor.execute(f"""
+            SELECT producto AS Producto, count(*) AS Cantidad_Ventas
+            FROM ventas WHERE {donde} AND convertido GROUP BY producto ORDER BY min(fila)
+        """, parametros).df()
+    if 'dias_convertidos' in claves:
+        secciones['dias_convertidos'] = cursor.execute(f"""
+            SELECT dias AS Dias_Hasta_Conversion FROM ventas WHERE {donde} AND convertido
+        """, parametros).df()['Dias_Hasta_Conversion']
+    return secciones
+
+# Memoria máxima (bytes) que ocupan los agregados guardados en la caché por estado de filtros
+AGGREGATE_CACHE_BYTES = 64 << 20
+
+# Caché LRU de agregados del proceso, compartida por todas las sesiones: cada entrada es
+# el resultado de una clave de compute_sections() para un estado de filtros normalizado
+@st.cache_resource
+def aggregate_cache():
+    return {
+        'entradas': OrderedDict(),  # (estado, clave) -> (valor, bytes), de más antigua a más reciente
+        'bytes': 0,
+        'aciertos': 0,
+        'fallos': 0,
+        'datos': None,  # datos de los que salen las entradas
+        'lock': threading.Lock(),
+    }
+
+# Estado de los filtros como clave de la caché: 'Todos' o ninguna selección es lo mismo
+# (no filtra) y el orden de los valores seleccionados no importa
+def filter_state_key(fecha_inicio, fecha_fin, selecciones):
+    return (fecha_inicio, fecha_fin, tuple(
+        (columna, tuple(sorted(seleccion)) if is_active(seleccion) else None)
+        for columna, seleccion in sorted(selecciones.items())
+    ))
+
+# Memoria que ocupa un agregado (tabla, serie o diccionario de totales)
+def aggregate_bytes(valor):
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(deep=True))
+    return 64 * len(valor)
+
+# Copia de un agregado para la sección que lo dibuja, que le añade o renombra columnas.
+# Con copy-on-write la copia superficial no duplica los datos y no altera la guardada
+def aggregate_copy(valor):
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        return valor.copy(deep=False)
+    return dict(valor)
+
+# compute_sections() (o su equivalente de DuckDB) con caché: las claves ya calculadas para
+# el mismo estado de filtros se sirven de la caché y solo se calculan las que faltan.
+# Se expulsan las entradas usadas hace más tiempo hasta que el total cabe en
+# AGGREGATE_CACHE_BYTES; la caché se vacía si los datos cambian (recarga del CSV)
+def cached_sections(datos, calcular_secciones, fecha_inicio, fecha_fin, selecciones, claves):
+    cache = aggregate_cache()
+    estado = filter_state_key(fecha_inicio, fecha_fin, selecciones)
+    secciones = {}
+    with cache['lock']:
+        if cache['datos'] is not datos:
+            cache['entradas'].clear()
+            cache['bytes'] = 0
+            cache['datos'] = datos
+        for clave in claves:
+            entrada = cache['entradas'].get((estado, clave))
+            if entrada is None:
+                cache['fallos'] += 1
+                continue
+            cache['aciertos'] += 1
+            cache['entradas'].move_to_end((estado, clave))
+            secciones[clave] = entrada[0]
+
+    pendientes = [clave for clave in claves if clave not in secciones]
+    if pendientes:
+        nuevas = calcular_secciones(datos, fecha_inicio, fecha_fin, selecciones, pendientes)
+        with cache['lock']:
+            if cache['datos'] is datos:
+                for clave, valor in nuevas.items():
+                    tamaño = aggregate_bytes(valor)
+                    if tamaño > AGGREGATE_CACHE_BYTES or (estado, clave) in cache['entradas']:
+                        continue
+                    cache['entradas'][(estado, clave)] = (valor, tamaño)
+                    cache['bytes'] += tamaño
+                while cache['bytes'] > AGGREGATE_CACHE_BYTES:
+                    _, (_, tamaño) = cache['entradas'].popitem(last=False)
+                    cache['bytes'] -= tamaño
+        secciones.update(nuevas)
+    return {clave: aggregate_copy(valor) for clave, valor in secciones.items()}
+
+# Métricas principales del rango y los filtros seleccionados (siempre visibles)
+def render_metrics(totales):
     st.header("📈 Métricas Principales")
-    
+
     col1, col2, col3, col4 = st.columns(4)
-    
-    total_registros = len(df_filtered)
-    total_ventas = df_filtered['Convertido'].sum()
+
+    total_registros = int(totales['Registros'])
+    total_ventas = int(totales['Ventas'])
     tasa_conversion = (total_ventas / total_registros * 100) if total_registros > 0 else 0
-    tiempo_promedio_conversion = df_filtered[df_filtered['Convertido']]['Dias_Hasta_Conversion'].mean()
-    
+    con_dias = totales['Con_Dias']
+    tiempo_promedio_conversion = totales['Suma_Dias'] / con_dias if con_dias > 0 else np.nan
+
     with col1:
         st.metric("Total de Registros", f"{total_registros:,}")
-    
+
     with col2:
         st.metric("Total de Ventas", f"{total_ventas:,}")
-    
+
     with col3:
         st.metric("Tasa de Conversión", f"{tasa_conversion:.2f}%")
-    
+
     with col4:
         st.metric("Tiempo Prom. Conversión", f"{tiempo_promedio_conversion:.1f} días" if not pd.isna(tiempo_promedio_conversion) else "N/A")
-    
+
     st.markdown("---")
-    
+
+# Sección mensual: registros, ventas y tasa de conversión por mes
+def render_monthly(secciones):
     # Análisis por mes
     st.header("📅 Análisis Mensual")
-    
+
     # Preparar datos mensuales
-    monthly_data = df_filtered.groupby('Mes_Año_Creacion').agg({
-        'Toma de contacto': 'count',
-        'Convertido': 'sum'
-    }).reset_index()
+    monthly_data = secciones['mensual']
 
     monthly_data['Tasa_Conversion'] = (monthly_data['Convertido'] / monthly_data['Toma de contacto'] * 100)
     monthly_data['Mes_Año'] = monthly_data['Mes_Año_Creacion'].astype(str)
@@ -182,22 +1218,21 @@ def main():
         labels={'Tasa_Conversion': 'Tasa de Conversión (%)'}
     )
     st.plotly_chart(fig_conversion_line, use_container_width=True)
-    
+
+# Sección anual
+def render_yearly(secciones):
     # Análisis por año
     st.header("📊 Análisis Anual")
-    
-    yearly_data = df_filtered.groupby('Año_Creacion').agg({
-        'Toma de contacto': 'count',
-        'Convertido': 'sum'
-    }).reset_index()
-    
+
+    yearly_data = secciones['anual']
+
     # Convertir 'Año_Creacion' a entero
     yearly_data['Año_Creacion'] = yearly_data['Año_Creacion'].astype(int)
-    
+
     yearly_data['Tasa_Conversion'] = (yearly_data['Convertido'] / yearly_data['Toma de contacto'] * 100)
-    
+
     col1, col2 = st.columns(2)
-    
+
     with col1:
         fig_yearly_bars = px.bar(
             yearly_data, 
@@ -207,7 +1242,7 @@ def main():
             barmode='group'
         )
         st.plotly_chart(fig_yearly_bars, use_container_width=True)
-    
+
     with col2:
         fig_yearly_line = px.line(
             yearly_data,
@@ -217,20 +1252,19 @@ def main():
             markers=True
         )
         st.plotly_chart(fig_yearly_line, use_container_width=True)
-    
+
+# Sección por toma de contacto
+def render_contact(secciones):
     # Análisis por toma de contacto
     st.header("📞 Análisis por Toma de Contacto")
-    
-    contacto_data = df_filtered.groupby('Toma de contacto').agg(
-        Total_Registros=('Toma de contacto', 'count'),
-        Total_Ventas=('Convertido', 'sum')
-    ).reset_index()
+
+    contacto_data = secciones['contacto']
     contacto_data.columns = ['Toma de contacto', 'Total_Registros', 'Total_Ventas']
     contacto_data['Tasa_Conversion'] = (contacto_data['Total_Ventas'] / contacto_data['Total_Registros'] * 100)
     contacto_data = contacto_data.sort_values('Total_Ventas', ascending=False)
-    
+
     col1, col2 = st.columns(2)
-    
+
     with col1:
         fig_contacto_pie = px.pie(
             contacto_data,
@@ -239,7 +1273,7 @@ def main():
             title='Distribución de Ventas por Toma de Contacto'
         )
         st.plotly_chart(fig_contacto_pie, use_container_width=True)
-    
+
     with col2:
         fig_contacto_bar = px.bar(
             contacto_data,
@@ -251,26 +1285,26 @@ def main():
         )
         fig_contacto_bar.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
         st.plotly_chart(fig_contacto_bar, use_container_width=True)
-    
+
     # Tabla de resumen por toma de contacto
     st.subheader("Resumen por Toma de Contacto")
     contacto_display = contacto_data.copy()
     contacto_display['Tasa_Conversion'] = contacto_display['Tasa_Conversion'].round(2).astype(str) + '%'
     st.dataframe(contacto_display, use_container_width=True)
-    
+
+# Sección por producto
+def render_product(secciones):
     # Análisis por producto
     st.header("🛍️ Análisis por Producto")
-    
-    producto_data = df_filtered[df_filtered['Convertido']].groupby('Producto').agg(
-        Cantidad_Ventas=('Producto', 'count')
-    ).reset_index()
+
+    producto_data = secciones['producto']
     producto_data.columns = ['Producto', 'Cantidad_Ventas']
     producto_data = producto_data.sort_values('Cantidad_Ventas', ascending=False)
     #producto_data = df_filtered[df_filtered['Convertido']].groupby('Producto').size().reset_index(name='Cantidad_Ventas')
     #producto_data = producto_data.sort_values('Cantidad_Ventas', ascending=False)
-    
+
     col1, col2 = st.columns(2)
-    
+
     with col1:
         fig_producto_bar = px.bar(
             producto_data.head(10),
@@ -280,7 +1314,7 @@ def main():
             title='Top 10 Productos más Vendidos'
         )
         st.plotly_chart(fig_producto_bar, use_container_width=True)
-    
+
     with col2:
         fig_producto_pie = px.pie(
             producto_data.head(8),
@@ -289,39 +1323,38 @@ def main():
             title='Distribución de Ventas por Producto (Top 8)'
         )
         st.plotly_chart(fig_producto_pie, use_container_width=True)
-    
+
+# Sección de análisis adicionales: tiempo hasta conversión y día de la semana
+def render_additional(secciones):
     # Análisis adicionales
     st.header("🔍 Análisis Adicionales")
-    
+
     # Análisis de tiempo hasta conversión
     col1, col2 = st.columns(2)
-    
+
     with col1:
-        if df_filtered[df_filtered['Convertido']]['Dias_Hasta_Conversion'].notna().any():
+        dias_convertidos = secciones['dias_convertidos']
+        if dias_convertidos.notna().any():
             fig_tiempo = px.histogram(
-                df_filtered[df_filtered['Convertido']],
+                dias_convertidos.to_frame(),
                 x='Dias_Hasta_Conversion',
                 title='Distribución del Tiempo hasta Conversión',
                 nbins=20
             )
             st.plotly_chart(fig_tiempo, use_container_width=True)
-    
+
     with col2:
         # Conversión por día de la semana
-        df_filtered['Dia_Semana'] = df_filtered['Fecha de Creación'].dt.day_name()
-        
+        dia_semana_data = secciones['semanal']
+
         # Definir el orden deseado para los días de la semana
         orden_dias = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        
+
         # Convertir 'Dia_Semana' a una categoría con el orden especificado
-        df_filtered['Dia_Semana'] = pd.Categorical(df_filtered['Dia_Semana'], categories=orden_dias, ordered=True)
-        
-        dia_semana_data = df_filtered.groupby('Dia_Semana').agg({
-            'Toma de contacto': 'count',
-            'Convertido': 'sum'
-        }).reset_index()
+        dia_semana_data['Dia_Semana'] = pd.Categorical.from_codes(dia_semana_data['Dia_Semana'], categories=orden_dias, ordered=True)
+
         dia_semana_data['Tasa_Conversion'] = (dia_semana_data['Convertido'] / dia_semana_data['Toma de contacto'] * 100)
-        
+
         fig_dia_semana = px.bar(
             dia_semana_data,
             x='Dia_Semana',
@@ -329,53 +1362,140 @@ def main():
             title='Tasa de Conversión por Día de la Semana'
         )
         st.plotly_chart(fig_dia_semana, use_container_width=True)
-    
+
+# Sección de tendencia temporal diaria
+def render_trend(secciones):
     # Tendencia temporal de conversión
-    st.subheader("📈 Tendencia Temporal de Conversión")
-    
+    st.header("📈 Tendencia Temporal de Conversión")
+
     # Crear datos diarios
-    df_filtered['Fecha_Solo'] = df_filtered['Fecha de Creación'].dt.date
-    daily_data = df_filtered.groupby('Fecha_Solo').agg({
-        'Toma de contacto': 'count',
-        'Convertido': 'sum'
-    }).reset_index()
+    daily_data = secciones['diario']
     daily_data['Tasa_Conversion'] = (daily_data['Convertido'] / daily_data['Toma de contacto'] * 100)
-    
+
     fig_tendencia = make_subplots(
         rows=2, cols=1,
         subplot_titles=('Registros y Ventas Diarias', 'Tasa de Conversión Diaria'),
         vertical_spacing=0.1
     )
-    
+
     fig_tendencia.add_trace(
         go.Scatter(x=daily_data['Fecha_Solo'], y=daily_data['Toma de contacto'],
                    mode='lines', name='Registros', line=dict(color='lightblue')),
         row=1, col=1
     )
-    
+
     fig_tendencia.add_trace(
         go.Scatter(x=daily_data['Fecha_Solo'], y=daily_data['Convertido'],
                    mode='lines', name='Ventas', line=dict(color='darkblue')),
         row=1, col=1
     )
-    
+
     fig_tendencia.add_trace(
         go.Scatter(x=daily_data['Fecha_Solo'], y=daily_data['Tasa_Conversion'],
                    mode='lines', name='Tasa Conversión (%)', line=dict(color='red')),
         row=2, col=1
     )
-    
+
     fig_tendencia.update_layout(height=600, showlegend=True)
     st.plotly_chart(fig_tendencia, use_container_width=True)
+
+# Secciones del panel que se eligen en el selector: datos de compute_sections() que
+# necesita cada una y función que la dibuja. Solo se calcula y dibuja la elegida
+PANEL_SECTIONS = {
+    '📅 Mensual': (['mensual'], render_monthly),
+    '📊 Anual': (['anual'], render_yearly),
+    '📞 Toma de Contacto': (['contacto'], render_contact),
+    '🛍️ Producto': (['producto'], render_product),
+    '🔍 Análisis Adicionales': (['dias_convertidos', 'semanal'], render_additional),
+    '📈 Tendencia Temporal': (['diario'], render_trend),
+}
+
+# Selector y sección elegida como fragmento de Streamlit. Sus entradas son los
+# argumentos (datos, motor y estado de los filtros): cambiar de sección vuelve a
+# ejecutar solo esta función, con los filtros de la última ejecución completa, sin
+# recalcular las métricas ni la barra lateral. Un cambio de filtros ejecuta todo el script
+@st.fragment
+def render_section_panel(datos, calcular_secciones, fecha_inicio, fecha_fin, selecciones):
+    seccion = st.radio("Sección", list(PANEL_SECTIONS), horizontal=True, label_visibility='collapsed')
+    claves, dibujar_seccion = PANEL_SECTIONS[seccion]
+    dibujar_seccion(cached_sections(datos, calcular_secciones, fecha_inicio, fecha_fin, selecciones, claves))
+
+# Función principal
+def main():
+    st.title("📊 Análisis Completo de Datos de Ventas")
+    st.markdown("---")
+    
+    # Cargar datos con el motor configurado
+    if DATA_BACKEND == 'duckdb':
+        datos = current_duckdb(ANALYSIS_WINDOW)
+        calcular_secciones = compute_sections_sql
+    else:
+        datos = current_data(ANALYSIS_WINDOW)
+        calcular_secciones = compute_sections
+    if datos is None:
+        return
+    info = dataset_info_sql(datos) if DATA_BACKEND == 'duckdb' else dataset_info(datos)
     
+    # Sidebar - Filtros
+    st.sidebar.header("🎛️ Filtros de Control")
+    
+    # Filtro por fecha de creación
+    min_date = info['min_date']
+    max_date = info['max_date']
+    
+    fecha_inicio = st.sidebar.date_input(
+        "Fecha de inicio",
+        value=min_date,
+        min_value=min_date,
+        max_value=max_date
+    )
+    
+    fecha_fin = st.sidebar.date_input(
+        "Fecha de fin",
+        value=max_date,
+        min_value=min_date,
+        max_value=max_date
+    )
     
-        
+    # Filtro por toma de contacto
+    tomas_contacto = ['Todos'] + info['contactos']
+    toma_seleccionada = st.sidebar.multiselect(
+        "Toma de contacto",
+        options=tomas_contacto,
+        default=[]
+    )
+    
+    # Filtro por producto
+    productos = ['Todos'] + info['productos']
+    producto_seleccionado = st.sidebar.multiselect(
+        "Producto",
+        options=productos,
+        default=[]
+    )
+    
+    # Aplicar filtros
+    selecciones = {
+        'Toma de contacto': toma_seleccionada,
+        'Producto': producto_seleccionado,
+    }
+    totales = cached_sections(datos, calcular_secciones, fecha_inicio, fecha_fin, selecciones, ['totales'])['totales']
+    total_registros = int(totales['Registros'])
+    render_metrics(totales)
+
+    # Solo se calculan y dibujan los datos de la sección elegida
+    render_section_panel(datos, calcular_secciones, fecha_inicio, fecha_fin, selecciones)
+
     # Información del dataset
     st.sidebar.markdown("---")
     st.sidebar.header("ℹ️ Información del Dataset")
-    st.sidebar.write(f"**Total de registros:** {len(df):,}")
-    st.sidebar.write(f"**Registros filtrados:** {len(df_filtered):,}")
-    st.sidebar.write(f"**Periodo:** {df['Fecha de Creación'].min().strftime('%Y-%m-%d')} a {df['Fecha de Creación'].max().strftime('%Y-%m-%d')}")
+    st.sidebar.write(f"**Total de registros:** {info['total']:,}")
+    st.sidebar.write(f"**Registros filtrados:** {total_registros:,}")
+    st.sidebar.write(f"**Periodo:** {min_date.strftime('%Y-%m-%d')} a {max_date.strftime('%Y-%m-%d')}")
+    cache = aggregate_cache()
+    st.sidebar.caption(
+        f"Caché de agregados: {cache['aciertos']:,} aciertos, {cache['fallos']:,} fallos, "
+        f"{len(cache['entradas'])} entradas ({cache['bytes'] / (1 << 20):.1f} MB)"
+    )
 
 if __name__ == "__main__":
     main()
\ No newline at end of file